@@ -0,0 +1,19 @@
+# =====================================================
+# Description  : Log directory lookup shared by the performance_test scripts
+# Log Dir      : /var/log/iperf_tests (for root)
+#              : ~/iperf_logs (for non-root users)
+# =====================================================
+
+import os
+
+# Evaluated once at import, whatever number of scripts/helpers ask for them
+IS_ROOT = os.geteuid() == 0
+USER_HOME = os.path.expanduser("~")
+LOG_DIR = "/var/log/iperf_tests" if IS_ROOT else os.path.join(USER_HOME, "iperf_logs")
+
+
+def resolve_log_dir():
+    # One stat() on later runs instead of a mkdir() that fails with EEXIST
+    if not os.path.isdir(LOG_DIR):
+        os.makedirs(LOG_DIR, exist_ok=True)
+    return LOG_DIR
@@ -19,14 +19,28 @@
 #   - v2.2 Default UDP bandwidth set to 1000M if not defined
 # =====================================================
 
-import subprocess
-import datetime
+import asyncio
 import os
 import argparse
+import json
 import re
 import socket
-import platform
+import struct
 import sys
+import time
+
+from iperf_logdir import resolve_log_dir
+
+# Precompiled Patterns
+# Ping statistics: packet loss and (if any reply came back) the avg RTT in one match
+_PING_LINUX = re.compile(rb"(?P<loss>\d+(?:\.\d+)?)% packet loss[^\n]*"
+                         rb"(?:\nrtt min/avg/max/mdev = [\d.]+/(?P<avg>[\d.]+)/[\d.]+/[\d.]+)?")
+_PING_MAC = re.compile(rb"(?P<loss>\d+(?:\.\d+)?)% packet loss[^\n]*"
+                       rb"(?:\n(?:rtt|round-trip)[^=\n]* = [\d.]+/(?P<avg>[\d.]+)/[\d.]+/[\d.]+)?")
+# iperf3 text summary line: bandwidth, then jitter and loss on UDP lines
+_UDP_SUMMARY = re.compile(rb"(?P<bw>\d+(?:\.\d+)? \wbits/sec)"
+                          rb"(?:\s+(?P<jit>\d+\.\d+)\s+ms\s+\d+/\d+\s+\((?P<loss>[\d.]+)%\))?")
+_BW = re.compile(rb"(\d+(?:\.\d+)? \wbits/sec)")
 
 # --- Argument Parser ---
 parser = argparse.ArgumentParser(description="Network Performance Test with iperf3 and ping.")
@@ -34,19 +48,24 @@ parser.add_argument("--duration", type=int, choices=[60, 300, 600], default=60,
                     help="Test duration in seconds")
 parser.add_argument("--server", type=str, required=True, help="IP address of iperf3 server")
 parser.add_argument("--port", type=int, default=5201, help="iperf3 server port (default: 5201)")
+parser.add_argument("--tcp-port", type=int, required=False,
+                    help="Separate iperf3 server port for the TCP test (default: --port). UDP and TCP then run "
+                         "concurrently on the same path, so TCP_BW/UDP_LOSS are not comparable with serial runs")
 parser.add_argument("--debug", action="store_true", help="Enable debug output")
 parser.add_argument("--udp-bandwidth", type=str, default="1000M", help="UDP test bandwidth (default: 1000M)")
 parser.add_argument("--direction", type=str, choices=["upload", "download"], default="upload",
                     help="Test direction (default: upload)")
 parser.add_argument("--os-mode", type=str, choices=["Linux", "MacOS"], required=False,
                     help="Override OS detection")
+parser.add_argument("--oneshot-json", action="store_true",
+                    help="Write the summary as one JSON record to iperf_summary.jsonl instead of KEY=VALUE fields")
 args = parser.parse_args()
 
 # --- Auto-detect OS ---
-auto_os = platform.system()
-if auto_os == "Darwin":
+# sys.platform is fixed at interpreter build time, no uname() call needed
+if sys.platform == "darwin":
     detected_os = "MacOS"
-elif auto_os == "Linux":
+elif sys.platform.startswith("linux"):
     detected_os = "Linux"
 else:
     detected_os = None
@@ -59,141 +78,296 @@ elif detected_os:
 else:
     print("[ERROR] Could not detect OS. Please provide --os-mode MacOS|Linux.")
     sys.exit(1)
+_PING = _PING_LINUX if os_mode == "Linux" else _PING_MAC
 
 # --- Define Paths ---
 duration = args.duration
 server_ip = args.server
 port = args.port
+tcp_port = args.tcp_port or port
 debug_mode = args.debug
+oneshot_json = args.oneshot_json
 direction = args.direction
 udp_bw = args.udp_bandwidth or "1000M"  # fallback if empty string
 
-timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-user_home = os.path.expanduser("~")
-is_root = (os.geteuid() == 0)
+# argv strings, converted once
+PORT_S = str(port)
+TCP_PORT_S = str(tcp_port)
+DUR_S = str(duration)
+HALFDUR_S = str(duration // 2)
 
-log_dir = "/var/log/iperf_tests" if is_root else os.path.join(user_home, "iperf_logs")
+timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
+log_dir = resolve_log_dir()
 tmp_dir = "/tmp"
-os.makedirs(log_dir, exist_ok=True)
 
-summary_log_file = os.path.join(log_dir, "iperf_summary.log")
+# JSON records get their own file so neither format's parsers see the other
+summary_log_file = os.path.join(log_dir, "iperf_summary.jsonl" if oneshot_json else "iperf_summary.log")
+mtu_cache_file = os.path.join(log_dir, "mtu_cache.json")
+mtu_cache_ttl = 24 * 3600  # MTU is a property of the path, re-probe once a day
 ping_tmp = os.path.join(tmp_dir, f"ping_{timestamp}.log")
 udp_tmp = os.path.join(tmp_dir, f"iperf3_udp_{timestamp}.log")
 tcp_tmp = os.path.join(tmp_dir, f"iperf3_tcp_{timestamp}.log")
+persist_tmp = True  # v2.2 has no --clean-tmp, raw outputs are always kept in /tmp
 
 # --- Helper Functions ---
-def run_and_save(cmd, tmpfile):
+async def run(cmd, tmpfile, persist=False):
     try:
-        with open(tmpfile, "w") as f:
-            subprocess.run(cmd, stdout=f, stderr=subprocess.STDOUT, text=True, timeout=duration + 30)
-        with open(tmpfile, "r") as f:
-            return f.read()
+        process = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE,
+                                                       stderr=asyncio.subprocess.STDOUT)
+        try:
+            output, _ = await asyncio.wait_for(process.communicate(), timeout=duration + 30)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise
+        if persist:
+            with open(tmpfile, "wb") as f:
+                f.write(output)
+        return output
+    except asyncio.TimeoutError:
+        return f"ERROR: Command '{cmd}' timed out".encode()
     except Exception as e:
-        return f"ERROR: {e}"
+        return f"ERROR: {e}".encode()
+
+async def port_open(addr, check_port):
+    _, writer = await asyncio.wait_for(asyncio.open_connection(addr, check_port), timeout=2)
+    writer.close()
+    await writer.wait_closed()
+
+def default_gateway():
+    # Linux only (/proc/net/route), used to tell paths apart in the MTU cache
+    try:
+        with open("/proc/net/route") as f:
+            for line in f.readlines()[1:]:
+                fields = line.split()
+                if fields[1] == "00000000" and int(fields[3], 16) & 0x2:
+                    return socket.inet_ntoa(struct.pack("<L", int(fields[2], 16)))
+    except (OSError, IndexError, ValueError):
+        pass
+    return ""
 
-def check_mtu(ip):
-    mtu_test = subprocess.run(["ping", "-c", "1", "-s", "1472", "-M", "do", ip], capture_output=True, text=True)
-    if "frag needed" in mtu_test.stderr or "Message too long" in mtu_test.stderr:
+async def check_mtu(ip):
+    key = f"{ip}|{default_gateway()}"
+    try:
+        with open(mtu_cache_file) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    if not isinstance(cache, dict):
+        cache = {}
+
+    entry = cache.get(key)
+    # Anything but {"mtu_ok": bool, "checked": number} is a cache miss
+    if (isinstance(entry, dict) and isinstance(entry.get("mtu_ok"), bool)
+            and isinstance(entry.get("checked"), (int, float))
+            and time.time() - entry["checked"] < mtu_cache_ttl):
+        mtu_ok = entry["mtu_ok"]
+    else:
+        mtu_output = await run(["ping", "-c", "1", "-s", "1472", "-M", "do", ip], None)
+        too_big = b"frag needed" in mtu_output or b"Message too long" in mtu_output
+        mtu_ok = not too_big
+        # Only cache a real answer: a reply, or an explicit "too big" error.
+        # Unknown host, lost probes or an unsupported -M (macOS) say nothing.
+        if too_big or b"bytes from" in mtu_output:
+            cache[key] = {"mtu_ok": mtu_ok, "checked": time.time()}
+            tmp_cache = f"{mtu_cache_file}.{os.getpid()}"
+            try:
+                with open(tmp_cache, "w") as f:
+                    json.dump(cache, f)
+                os.replace(tmp_cache, mtu_cache_file)
+            except OSError:
+                pass
+
+    if not mtu_ok:
         print("[WARNING] MTU issue detected. Consider adjusting MTU if UDP loss is high.")
+    return mtu_ok
 
-# --- Reachability Check ---
-ping_status = False
-try:
-    socket.gethostbyname(server_ip)
-    ping_check = subprocess.run(["ping", "-c", "3", server_ip], capture_output=True, text=True)
-    if "0% packet loss" in ping_check.stdout or "1% packet loss" in ping_check.stdout:
-        ping_status = True
-except Exception:
-    ping_status = False
+def json_num(value):
+    # Summary field -> JSON number: "12.9%" -> 12.9, "0.200ms" -> 0.2, "-" -> None
+    if value == "-":
+        return None
+    if isinstance(value, str):
+        return float(value.rstrip("%ms"))
+    return value
 
-# --- Initialize Results ---
-status = "FAIL"
-latency_avg = "-"
-packet_loss = "-"
-udp_bw_result = udp_jitter = udp_ploss = "-"
-tcp_bw_result = "-"
+def format_bps(bps):
+    if bps == "-":
+        return bps
+    value = float(bps)
+    units = ["", "K", "M", "G", "T"]
+    unit = 0
+    while value >= 1000 and unit < len(units) - 1:
+        value /= 1000
+        unit += 1
+    if value < 10:
+        return f"{value:.2f} {units[unit]}bits/sec"
+    if value < 100:
+        return f"{value:.1f} {units[unit]}bits/sec"
+    return f"{value:.0f} {units[unit]}bits/sec"
 
-if ping_status:
-    status = "OK"
-    check_mtu(server_ip)
+_UNIT_SCALE = {"K": 10**3, "M": 10**6, "G": 10**9, "T": 10**12}
 
-    print("[INFO] Running latency test (ping)...")
-    ping_output = run_and_save(["ping", "-c", str(duration // 2), server_ip], ping_tmp)
+def to_bps(bw):
+    # "88.5 Mbits/sec" -> 88500000, canonical value for the *_BW_BPS fields
+    value, unit = bw.split()
+    return round(float(value) * _UNIT_SCALE.get(unit[0], 1))
 
-    if os_mode == "Linux":
-        match = re.search(r"rtt min/avg/max/mdev = [\d\.]+/([\d\.]+)/[\d\.]+/[\d\.]+", ping_output)
-    elif os_mode == "MacOS":
-        match = re.search(r"(?:rtt|round-trip).* = [\d\.]+/([\d\.]+)/[\d\.]+/[\d\.]+", ping_output)
-    else:
-        match = None
+def last_line_with(output, marker):
+    # Walk back from the end of the output: iperf3 prints its summary last
+    idx = output.rfind(marker)
+    while idx != -1:
+        line_start = output.rfind(b"\n", 0, idx) + 1
+        line_end = output.find(b"\n", idx)
+        line = output[line_start:line_end if line_end != -1 else len(output)]
+        if b"bits/sec" in line:
+            return line.strip()
+        idx = output.rfind(marker, 0, line_start)
+    return b""
 
+def parse_udp_text(output):
+    udp_bw_bps = udp_jitter = udp_ploss = "-"
+    udp_line = last_line_with(output, b"sender" if direction == "download" else b"receiver")
+
+    match = _UDP_SUMMARY.search(udp_line)
     if match:
-        latency_avg = match.group(1) + "ms"
+        fields = match.groupdict()
+        udp_bw_bps = to_bps(fields["bw"].decode("ascii"))
+        if fields["jit"]:
+            udp_jitter = fields["jit"].decode("ascii") + "ms"
+            udp_ploss = fields["loss"].decode("ascii") + "%"
+    return udp_bw_bps, udp_jitter, udp_ploss
+
+def parse_tcp_text(output):
+    tcp_bw_bps = "-"
+    tcp_line = last_line_with(output, b"receiver")
 
-    ploss_match = re.search(r"(\d+)% packet loss", ping_output)
-    if ploss_match:
-        packet_loss = ploss_match.group(1) + "%"
+    if tcp_line:
+        tcp_bw_match = _BW.search(tcp_line)
+        if tcp_bw_match:
+            tcp_bw_bps = to_bps(tcp_bw_match.group(1).decode("ascii"))
+    return tcp_bw_bps
+
+def udp_received_bps(end, udp_sum):
+    if end.get("sum_received"):
+        return int(end["sum_received"]["bits_per_second"])
+    # Older iperf3 builds only report "sum", which is the sending side's rate
+    # when this end sent the stream: scale it by the datagrams that arrived
+    if not udp_sum.get("sender", direction == "upload"):
+        return int(udp_sum["bits_per_second"])
+    packets = udp_sum.get("packets")
+    if not packets:
+        return "-"
+    delivered = (packets - udp_sum.get("lost_packets", 0)) / packets
+    return int(udp_sum["bits_per_second"] * delivered)
+
+def parse_udp(output):
+    try:
+        end = json.loads(output).get("end", {})
+    except ValueError:
+        # Not JSON (iperf3 without -J support): scan the text summary line
+        return parse_udp_text(output)
+    udp_sum = end.get("sum")
+    if not udp_sum:
+        return "-", "-", "-"
+    return (udp_received_bps(end, udp_sum),
+            f"{udp_sum['jitter_ms']:.3f}ms",
+            f"{round(udp_sum['lost_percent'], 2):g}%")
 
-    print("[INFO] Running UDP test (jitter, loss, bandwidth)...")
-    udp_args = ["iperf3", "-c", server_ip, "-p", str(port), "-u", "-t", str(duration), "-b", udp_bw]
-    if direction == "download":
-        udp_args.append("-R")
+def parse_tcp(output):
+    try:
+        end = json.loads(output).get("end", {})
+    except ValueError:
+        return parse_tcp_text(output)
+    received = end.get("sum_received")
+    if not received:
+        return "-"
+    return int(received["bits_per_second"])
 
-    udp_output = run_and_save(udp_args, udp_tmp)
+# --- Test Run ---
+check_ports = sorted({port, tcp_port})
+reverse = ["-R"] if direction == "download" else []
+ping_args = ["ping", "-c", HALFDUR_S, server_ip]
+udp_args = ["iperf3", "-c", server_ip, "-p", PORT_S, "-u", "-t", DUR_S, "-b", udp_bw, "-J", *reverse]
+tcp_args = ["iperf3", "-c", server_ip, "-p", TCP_PORT_S, "-t", DUR_S, "-J", *reverse]
 
-    udp_line = ""
-    for line in udp_output.splitlines():
-        if direction == "download" and "sender" in line and "bits/sec" in line:
-            udp_line = line.strip()
-        elif direction == "upload" and "receiver" in line and "bits/sec" in line:
-            udp_line = line.strip()
+async def main():
+    # TCP connect to the iperf3 port(s): one round trip, and not fooled by filtered ICMP
+    try:
+        server_addr = socket.gethostbyname(server_ip)
+        await asyncio.gather(*(port_open(server_addr, check_port) for check_port in check_ports))
+    except Exception:
+        return None
+    print(f"[INFO] Server {server_ip} ({server_addr}) reachable")
+    if direction == "upload":  # local MTU does not matter for the server->client path
+        await check_mtu(server_ip)
 
-    if udp_line:
-        udp_bw_match = re.search(r"(\d+(?:\.\d+)? \wbits/sec)", udp_line)
-        if udp_bw_match:
-            udp_bw_result = udp_bw_match.group(1)
+    print("[INFO] Running latency test (ping)...")
+    ping_output = await run(ping_args, ping_tmp, persist_tmp)
 
-        udp_jitter_match = re.search(r"(\d+\.\d+)\s+ms\s+\d+/", udp_line)
-        if udp_jitter_match:
-            udp_jitter = udp_jitter_match.group(1) + "ms"
+    if tcp_port != port:
+        # One test per iperf3 server at a time: overlap only across two ports
+        print(f"[INFO] Running UDP (port {port}) and TCP (port {tcp_port}) tests concurrently...")
+        udp_output, tcp_output = await asyncio.gather(run(udp_args, udp_tmp, persist_tmp),
+                                                      run(tcp_args, tcp_tmp, persist_tmp))
+    else:
+        print("[INFO] Running UDP test (jitter, loss, bandwidth)...")
+        udp_output = await run(udp_args, udp_tmp, persist_tmp)
+        print("[INFO] Running TCP test (bandwidth)...")
+        tcp_output = await run(tcp_args, tcp_tmp, persist_tmp)
+    return ping_output, udp_output, tcp_output
 
-        udp_loss_match = re.search(r"\(([\d\.]+)%\)", udp_line)
-        if udp_loss_match:
-            udp_ploss = udp_loss_match.group(1) + "%"
+results = asyncio.run(main())
+ping_status = results is not None
 
-    print("[INFO] Running TCP test (bandwidth)...")
-    tcp_args = ["iperf3", "-c", server_ip, "-p", str(port), "-t", str(duration)]
-    if direction == "download":
-        tcp_args.append("-R")
+# --- Initialize Results ---
+status = "FAIL"
+latency_avg = "-"
+packet_loss = "-"
+udp_bw_bps = udp_jitter = udp_ploss = "-"
+tcp_bw_bps = "-"
 
-    tcp_output = run_and_save(tcp_args, tcp_tmp)
+if ping_status:
+    status = "OK"
+    ping_output, udp_output, tcp_output = results
 
-    tcp_line = ""
-    for line in tcp_output.splitlines():
-        if "receiver" in line and "bits/sec" in line:
-            tcp_line = line.strip()
+    match = _PING.search(ping_output)
+    if match:
+        packet_loss = match.group("loss").decode("ascii") + "%"
+        if match.group("avg"):
+            latency_avg = match.group("avg").decode("ascii") + "ms"
 
-    if tcp_line:
-        tcp_bw_match = re.search(r"(\d+(?:\.\d+)? \wbits/sec)", tcp_line)
-        if tcp_bw_match:
-            tcp_bw_result = tcp_bw_match.group(1)
+    udp_bw_bps, udp_jitter, udp_ploss = parse_udp(udp_output)
+    tcp_bw_bps = parse_tcp(tcp_output)
 
     if debug_mode:
-        print("\n[DEBUG] Ping Output:\n", ping_output)
-        print("\n[DEBUG] UDP Output:\n", udp_output)
-        print("\n[DEBUG] UDP Parsed Line:\n", udp_line)
-        print("\n[DEBUG] TCP Output:\n", tcp_output)
-        print("\n[DEBUG] TCP Parsed Line:\n", tcp_line)
+        print("\n[DEBUG] Ping Output:\n", ping_output.decode(errors="replace"))
+        print("\n[DEBUG] UDP Output:\n", udp_output.decode(errors="replace"))
+        print("\n[DEBUG] TCP Output:\n", tcp_output.decode(errors="replace"))
 
 else:
-    print(f"[ERROR] Server {server_ip} unreachable. Test aborted.")
+    print(f"[ERROR] Server {server_ip} unreachable on iperf3 port(s) {', '.join(map(str, check_ports))}. Test aborted.")
 
 # --- Final Summary ---
-summary_line = (f"{timestamp} STATUS={status} SERVER={server_ip}:{port} DURATION={duration}s "
-                f"LATENCY={latency_avg} PING_LOSS={packet_loss} "
-                f"UDP_BW={udp_bw_result} UDP_JITTER={udp_jitter} UDP_LOSS={udp_ploss} "
-                f"TCP_BW={tcp_bw_result}")
+if oneshot_json:
+    summary_line = json.dumps({
+        "timestamp": timestamp, "status": status, "server": server_ip, "port": port, "duration": duration,
+        "latency_ms": json_num(latency_avg), "ping_loss_pct": json_num(packet_loss),
+        "udp_bw_bps": json_num(udp_bw_bps), "udp_jitter_ms": json_num(udp_jitter),
+        "udp_loss_pct": json_num(udp_ploss), "tcp_bw_bps": json_num(tcp_bw_bps),
+    }, separators=(",", ":"))
+else:
+    udp_bw_result = format_bps(udp_bw_bps)
+    tcp_bw_result = format_bps(tcp_bw_bps)
+    summary_line = (f"{timestamp} STATUS={status} SERVER={server_ip}:{port} DURATION={duration}s "
+                    f"LATENCY={latency_avg} PING_LOSS={packet_loss} "
+                    f"UDP_BW={udp_bw_result} UDP_BW_BPS={udp_bw_bps} UDP_JITTER={udp_jitter} UDP_LOSS={udp_ploss} "
+                    f"TCP_BW={tcp_bw_result} TCP_BW_BPS={tcp_bw_bps}")
 
 print("\n[RESULT] " + summary_line)
-with open(summary_log_file, "a") as f:
-    f.write(summary_line + "\n")
\ No newline at end of file
+# One write() on an O_APPEND fd is atomic for a short line, so summary lines
+# from overlapping cron runs cannot interleave
+fd = os.open(summary_log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+try:
+    os.write(fd, (summary_line + "\n").encode())
+finally:
+    os.close(fd)
\ No newline at end of file
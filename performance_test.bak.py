@@ -3,7 +3,7 @@
 # Author       : Marion Renaldo Rotensulu
 # Version      : v1.5
 # Description  : Custom Performance test
-# Log File     : /var/log/iperf_tests/iperf_summary.log
+# Log File     : /var/log/iperf_tests/iperf_summary.log (or ~/iperf_logs if not root)
 # Last Updated : 2025-03-23
 # Changelog    :
 #   - v1.0 Basic summary output
@@ -17,11 +17,20 @@
 # =====================================================
 
 import subprocess
-import datetime
 import os
 import argparse
 import re
 import socket
+import time
+
+from iperf_logdir import resolve_log_dir
+
+# Precompiled Patterns
+_RTT = re.compile(rb"rtt min/avg/max/mdev = [\d.]+/([\d.]+)/[\d.]+/[\d.]+")
+_PLOSS = re.compile(rb"(\d+)% packet loss")
+_BW = re.compile(rb"(\d+(?:\.\d+)? \wbits/sec)")
+_JITTER = re.compile(rb"(\d+\.\d+)\s+ms\s+\d+/")
+_LOSS_PCT = re.compile(rb"\(([\d.]+)%\)")
 
 # Argument Parser
 parser = argparse.ArgumentParser(description="Network Test Summary Script (Syslog Style + Live Output + Temp Logs)")
@@ -38,11 +47,10 @@ duration = args.duration
 debug_mode = args.debug
 
 # Paths
-log_dir = "/var/log/iperf_tests"
+log_dir = resolve_log_dir()
 tmp_dir = "/tmp"
-os.makedirs(log_dir, exist_ok=True)
 
-timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
 summary_log_file = os.path.join(log_dir, "iperf_summary.log")
 ping_tmp = os.path.join(tmp_dir, f"ping_{timestamp}.log")
 udp_tmp = os.path.join(tmp_dir, f"iperf3_udp_{timestamp}.log")
@@ -51,19 +59,31 @@ tcp_tmp = os.path.join(tmp_dir, f"iperf3_tcp_{timestamp}.log")
 # Helper
 def run_and_save(cmd, tmpfile):
     try:
-        with open(tmpfile, "w") as f:
-            subprocess.run(cmd, stdout=f, stderr=subprocess.STDOUT, text=True, timeout=duration + 30)
-        with open(tmpfile, "r") as f:
+        with open(tmpfile, "wb") as f:
+            subprocess.run(cmd, stdout=f, stderr=subprocess.STDOUT, timeout=duration + 30)
+        with open(tmpfile, "rb") as f:
             return f.read()
     except Exception as e:
-        return f"ERROR: {e}"
+        return f"ERROR: {e}".encode()
+
+def last_line_with(output, marker):
+    # Walk back from the end of the output: iperf3 prints its summary last
+    idx = output.rfind(marker)
+    while idx != -1:
+        line_start = output.rfind(b"\n", 0, idx) + 1
+        line_end = output.find(b"\n", idx)
+        line = output[line_start:line_end if line_end != -1 else len(output)]
+        if b"bits/sec" in line:
+            return line.strip()
+        idx = output.rfind(marker, 0, line_start)
+    return b""
 
 # Reachability Check
 ping_status = False
 try:
     socket.gethostbyname(server_ip)
-    ping_check = subprocess.run(["ping", "-c", "3", server_ip], capture_output=True, text=True)
-    if "0% packet loss" in ping_check.stdout or "1% packet loss" in ping_check.stdout:
+    ping_check = subprocess.run(["ping", "-c", "3", server_ip], capture_output=True)
+    if b"0% packet loss" in ping_check.stdout or b"1% packet loss" in ping_check.stdout:
         ping_status = True
 except Exception:
     ping_status = False
@@ -79,54 +99,48 @@ if ping_status:
     status = "OK"
     print("[INFO] Running latency test (ping)...")
     ping_output = run_and_save(["ping", "-c", str(duration // 2), server_ip], ping_tmp)
-    match = re.search(r"rtt min/avg/max/mdev = [\d\.]+/([\d\.]+)/[\d\.]+/[\d\.]+", ping_output)
+    match = _RTT.search(ping_output)
     if match:
-        latency_avg = match.group(1) + "ms"
-    ploss_match = re.search(r"(\d+)% packet loss", ping_output)
+        latency_avg = match.group(1).decode("ascii") + "ms"
+    ploss_match = _PLOSS.search(ping_output)
     if ploss_match:
-        packet_loss = ploss_match.group(1) + "%"
+        packet_loss = ploss_match.group(1).decode("ascii") + "%"
 
     print("[INFO] Running UDP test (jitter, packet loss, bandwidth)...")
     udp_output = run_and_save(["iperf3", "-c", server_ip, "-p", str(port), "-u", "-t", str(duration), "-b", "1000M"], udp_tmp)
 
     # ✅ Fixed UDP Parsing (now supports integer or float BW)
-    udp_receiver_line = ""
-    for line in udp_output.splitlines():
-        if "receiver" in line and "bits/sec" in line:
-            udp_receiver_line = line.strip()
+    udp_receiver_line = last_line_with(udp_output, b"receiver")
 
     if udp_receiver_line:
-        udp_bw_match = re.search(r"(\d+(?:\.\d+)? \wbits/sec)", udp_receiver_line)
+        udp_bw_match = _BW.search(udp_receiver_line)
         if udp_bw_match:
-            udp_bw = udp_bw_match.group(1)
+            udp_bw = udp_bw_match.group(1).decode("ascii")
 
-        udp_jitter_match = re.search(r"(\d+\.\d+)\s+ms\s+\d+/", udp_receiver_line)
+        udp_jitter_match = _JITTER.search(udp_receiver_line)
         if udp_jitter_match:
-            udp_jitter = udp_jitter_match.group(1) + "ms"
+            udp_jitter = udp_jitter_match.group(1).decode("ascii") + "ms"
 
-        udp_loss_match = re.search(r"\(([\d\.]+)%\)", udp_receiver_line)
+        udp_loss_match = _LOSS_PCT.search(udp_receiver_line)
         if udp_loss_match:
-            udp_ploss = udp_loss_match.group(1) + "%"
+            udp_ploss = udp_loss_match.group(1).decode("ascii") + "%"
 
     print("[INFO] Running TCP test (bandwidth)...")
     tcp_output = run_and_save(["iperf3", "-c", server_ip, "-p", str(port), "-t", str(duration)], tcp_tmp)
 
-    tcp_receiver_line = ""
-    for line in tcp_output.splitlines():
-        if "receiver" in line and "bits/sec" in line:
-            tcp_receiver_line = line.strip()
+    tcp_receiver_line = last_line_with(tcp_output, b"receiver")
 
     if tcp_receiver_line:
-        tcp_bw_match = re.search(r"(\d+(?:\.\d+)? \wbits/sec)", tcp_receiver_line)
+        tcp_bw_match = _BW.search(tcp_receiver_line)
         if tcp_bw_match:
-            tcp_bw = tcp_bw_match.group(1)
+            tcp_bw = tcp_bw_match.group(1).decode("ascii")
 
     if debug_mode:
-        print("\n[DEBUG] Ping Output:\n", ping_output)
-        print("\n[DEBUG] UDP Output:\n", udp_output)
-        print("\n[DEBUG] UDP Parsed Line:\n", udp_receiver_line)
-        print("\n[DEBUG] TCP Output:\n", tcp_output)
-        print("\n[DEBUG] TCP Parsed Line:\n", tcp_receiver_line)
+        print("\n[DEBUG] Ping Output:\n", ping_output.decode(errors="replace"))
+        print("\n[DEBUG] UDP Output:\n", udp_output.decode(errors="replace"))
+        print("\n[DEBUG] UDP Parsed Line:\n", udp_receiver_line.decode(errors="replace"))
+        print("\n[DEBUG] TCP Output:\n", tcp_output.decode(errors="replace"))
+        print("\n[DEBUG] TCP Parsed Line:\n", tcp_receiver_line.decode(errors="replace"))
 
 else:
     print(f"[ERROR] Server {server_ip} unreachable. Test aborted.")
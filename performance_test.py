@@ -11,6 +11,7 @@
 #
 # Log Output   : /var/log/iperf_tests/iperf_summary.log (for root)
 #              : ~/iperf_logs/iperf_summary.log (for non-root users)
+#              : iperf_summary.jsonl in the same directory with --oneshot-json
 #
 # Temp Logs    : /tmp/ping_*.log, /tmp/iperf3_udp_*.log, /tmp/iperf3_tcp_*.log
 # Last Updated : 2025-06-13
@@ -29,170 +30,413 @@
 #   - v2.2 Default UDP bandwidth set to 1000M if not defined
 #   - v2.3 Added --clean-tmp option to remove all temp log files after test,
 #          live ping during iperf, post-test ping parsing, and combined debug log
+#   - v2.4 iperf3 runs in JSON mode (-J), bandwidth/jitter/loss read from the
+#          "end" block with a plain-text regex fallback
+#   - v2.5 Added --tcp-port to run UDP and TCP tests concurrently against two
+#          iperf3 servers, subprocess output read via communicate()
+#   - v2.6 Outputs parsed in memory, /tmp raw logs only written when kept
+#          (--debug or no --clean-tmp)
+#   - v2.7 Reachability check via TCP connect to the iperf3 port(s) instead of ping
+#   - v2.8 One ping process for the whole run, baseline/live/post windows sliced
+#          from its replies by icmp_seq
+#   - v2.9 Per-window RTT p50/p95/p99 and mdev (NumPy when installed), P95/MDEV
+#          added to the summary line
+#   - v2.10 Summary line appended with a single O_APPEND write
+#   - v2.11 Subprocess output kept as bytes, parsed with bytes patterns
+#   - v2.12 asyncio driver: reachability probe, ping and iperf3 tests run as
+#           subprocesses awaited on one event loop instead of blocking threads
+#   - v2.13 UDP_BW_BPS/TCP_BW_BPS integer bits/sec fields in the summary line
+#   - v2.14 Log directory resolved by the shared iperf_logdir module
+#   - v2.15 ping/iperf3 argv built once after argument parsing
+#   - v2.16 ping always reaped (kill after 2 s), sequential read hint on its log
+#   - v2.17 Run timestamp formatted with time.strftime, datetime import dropped
+#   - v2.18 Added --oneshot-json to write the summary as a single JSON record
 # =====================================================
 
-import subprocess
-import datetime
+import asyncio
 import os
 import argparse
+import json
+import math
 import re
 import socket
-import platform
-import shutil
+import signal
+import statistics
 import sys
-import threading
+import time
+
+from iperf_logdir import resolve_log_dir
+
+try:
+    import numpy as np
+except ImportError:  # optional, RTT statistics fall back to the statistics module
+    np = None
+
+# Precompiled Patterns
+# Ping reply: "64 bytes from x: icmp_seq=12 ttl=57 time=10.2 ms" (Linux and macOS)
+_PING_REPLY = re.compile(rb"icmp_seq=(\d+) .*?time=([\d.]+) ms")
+# iperf3 text summary line: bandwidth, then jitter and loss on UDP lines
+_UDP_SUMMARY = re.compile(rb"(?P<bw>\d+(?:\.\d+)? \wbits/sec)"
+                          rb"(?:\s+(?P<jit>\d+\.\d+)\s+ms\s+\d+/\d+\s+\((?P<loss>[\d.]+)%\))?")
+_BW = re.compile(rb"(\d+(?:\.\d+)? \wbits/sec)")
 
 # Argument Parser
 parser = argparse.ArgumentParser(description="Network Performance Test Script (Syslog Style + Live Output + Cleanup)")
 parser.add_argument("--duration", type=int, choices=[60, 300, 600], default=60, help="Test duration in seconds")
 parser.add_argument("--server", type=str, required=True, help="IP address of iperf3 server")
 parser.add_argument("--port", type=int, default=5201, help="iperf3 server port")
+parser.add_argument("--tcp-port", type=int, help="Separate iperf3 server port for the TCP test (runs UDP and TCP concurrently: they share the path, so TCP_BW/UDP_LOSS are not comparable with serial runs)")
 parser.add_argument("--udp-bandwidth", type=str, default="1000M", help="UDP test bandwidth")
 parser.add_argument("--direction", choices=["upload", "download"], default="upload", help="Test direction")
 parser.add_argument("--debug", action="store_true", help="Enable debug output")
 parser.add_argument("--os-mode", choices=["Linux", "MacOS"], help="Override OS auto-detection")
 parser.add_argument("--clean-tmp", action="store_true", help="Clean up temp files after test")
+parser.add_argument("--oneshot-json", action="store_true", help="Write the summary as one JSON record to iperf_summary.jsonl instead of KEY=VALUE fields")
 args = parser.parse_args()
+tcp_port = args.tcp_port or args.port
+half_duration = args.duration // 2
+
+# argv strings, converted once
+PORT_S = str(args.port)
+TCP_PORT_S = str(tcp_port)
+DUR_S = str(args.duration)
 
 # OS Detection
-detected_os = platform.system()
-os_mode = args.os_mode or ("MacOS" if detected_os.lower() == "darwin" else "Linux")
+# sys.platform is fixed at interpreter build time, no uname() call needed
+os_mode = args.os_mode or ("MacOS" if sys.platform == "darwin" else "Linux")
 os_mode = os_mode.capitalize()
+# First icmp_seq number: iputils ping counts from 1, BSD/macOS ping from 0
+seq_base = 1 if os_mode == "Linux" else 0
 
 # Timestamp
-timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
 
 # Logging Paths
-is_root = os.geteuid() == 0
-log_dir = "/var/log/iperf_tests" if is_root else os.path.expanduser("~/iperf_logs")
-os.makedirs(log_dir, exist_ok=True)
-summary_log_file = os.path.join(log_dir, "iperf_summary.log")
+log_dir = resolve_log_dir()
+# JSON records get their own file so neither format's parsers see the other
+summary_log_file = os.path.join(log_dir, "iperf_summary.jsonl" if args.oneshot_json else "iperf_summary.log")
 
 # Temp Paths
 tmp_dir = "/tmp"
 ping_tmp = os.path.join(tmp_dir, f"ping_{timestamp}.log")
-ping_live_tmp = os.path.join(tmp_dir, f"ping_live_{timestamp}.log")
-ping_post_tmp = os.path.join(tmp_dir, f"ping_post_{timestamp}.log")
 udp_tmp = os.path.join(tmp_dir, f"iperf3_udp_{timestamp}.log")
 tcp_tmp = os.path.join(tmp_dir, f"iperf3_tcp_{timestamp}.log")
+# Raw outputs are parsed in memory; only write them out if they are kept
+persist_tmp = args.debug or not args.clean_tmp
 
 # Helper Function
 
-def run_and_save(cmd, tmpfile, live=False):
-    with open(tmpfile, "w") as f:
-        process = subprocess.Popen(cmd, stdout=f, stderr=subprocess.STDOUT, text=True)
-        if live:
-            return process
+async def run(cmd, tmpfile, persist=False):
+    process = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE,
+                                                   stderr=asyncio.subprocess.STDOUT)
+    try:
+        output, _ = await asyncio.wait_for(process.communicate(), timeout=args.duration + 30)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return f"ERROR: Command '{cmd}' timed out".encode()
+    if persist:
+        with open(tmpfile, "wb") as f:
+            f.write(output)
+    return output
+
+async def run_live(cmd, tmpfile):
+    with open(tmpfile, "wb") as f:
+        return await asyncio.create_subprocess_exec(*cmd, stdout=f, stderr=asyncio.subprocess.STDOUT)
+
+async def stop_ping(process):
+    # SIGINT lets ping flush its buffered replies to the log before exiting;
+    # always reap it, killing it if it has not exited within 2 s. ping may
+    # already be gone (no CAP_NET_RAW, network unreachable): nothing to signal.
+    try:
+        process.send_signal(signal.SIGINT)
+    except ProcessLookupError:
+        pass
+    try:
+        await asyncio.wait_for(process.wait(), timeout=2)
+    except asyncio.TimeoutError:
         try:
-            process.wait(timeout=args.duration + 30)
-        except subprocess.TimeoutExpired:
             process.kill()
-            return f"ERROR: Command '{cmd}' timed out"
-    with open(tmpfile, "r") as f:
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+def read_log(path):
+    with open(path, "rb") as f:
+        if hasattr(os, "posix_fadvise"):  # Linux: let the kernel read ahead the whole log
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
         return f.read()
 
-# Regex ping parser
-
-def parse_ping(filepath):
-    avg_latency = "-"
-    loss = "-"
-    with open(filepath, "r") as f:
-        text = f.read()
-        loss_match = re.search(r"(\d+)% packet loss", text)
-        if loss_match:
-            loss = loss_match.group(1) + "%"
-        if os_mode == "Linux":
-            match = re.search(r"rtt min/avg/max/mdev = [\d\.]+/([\d\.]+)/[\d\.]+/[\d\.]+", text)
-        else:
-            match = re.search(r"(?:rtt|round-trip).* = [\d\.]+/([\d\.]+)/[\d\.]+/[\d\.]+", text)
+async def port_open(addr, port):
+    _, writer = await asyncio.wait_for(asyncio.open_connection(addr, port), timeout=2)
+    writer.close()
+    await writer.wait_closed()
+
+# Ping parser
+
+def parse_ping_samples(text):
+    samples = {}
+    for match in _PING_REPLY.finditer(text):
+        # setdefault: a (DUP!) reply must not overwrite the first one
+        samples.setdefault(int(match.group(1)), float(match.group(2)))
+    return samples
+
+def ping_window(samples, first, last):
+    # Replies to echo requests first .. last-1 (icmp_seq), lost ones count as loss
+    if last <= first:
+        return [], "-"
+    rtts = [samples[seq] for seq in range(first, last) if seq in samples]
+    loss = 100 * (last - first - len(rtts)) / (last - first)
+    return rtts, f"{round(loss, 1):g}%"
+
+def rtt_stats(rtts):
+    if not rtts:
+        return {}
+    if np is not None:
+        arr = np.fromiter(rtts, dtype=np.float64, count=len(rtts))
+        p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+        mdev = arr.std(ddof=1) if arr.size > 1 else 0.0
+        return {"avg": float(arr.mean()), "p50": float(p50), "p95": float(p95),
+                "p99": float(p99), "mdev": float(mdev)}
+    if len(rtts) > 1:
+        # "inclusive" matches NumPy's default linear interpolation
+        cuts = statistics.quantiles(rtts, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+        mdev = statistics.stdev(rtts)
+    else:
+        p50 = p95 = p99 = rtts[0]
+        mdev = 0.0
+    return {"avg": statistics.fmean(rtts), "p50": p50, "p95": p95, "p99": p99, "mdev": mdev}
+
+def fmt_ms(stats, key):
+    return f"{stats[key]:.3f}ms" if stats else "-"
+
+def json_ms(stats, key):
+    return round(stats[key], 3) if stats else None
+
+def json_num(value):
+    # Summary field -> JSON number: "12.9%" -> 12.9, "0.200ms" -> 0.2, "-" -> None
+    if value == "-":
+        return None
+    if isinstance(value, str):
+        return float(value.rstrip("%ms"))
+    return value
+
+# iperf3 parsers
+
+def format_bps(bps):
+    if bps == "-":
+        return bps
+    value = float(bps)
+    units = ["", "K", "M", "G", "T"]
+    unit = 0
+    while value >= 1000 and unit < len(units) - 1:
+        value /= 1000
+        unit += 1
+    if value < 10:
+        return f"{value:.2f} {units[unit]}bits/sec"
+    if value < 100:
+        return f"{value:.1f} {units[unit]}bits/sec"
+    return f"{value:.0f} {units[unit]}bits/sec"
+
+_UNIT_SCALE = {"K": 10**3, "M": 10**6, "G": 10**9, "T": 10**12}
+
+def to_bps(bw):
+    # "88.5 Mbits/sec" -> 88500000, canonical value for the *_BW_BPS fields
+    value, unit = bw.split()
+    return round(float(value) * _UNIT_SCALE.get(unit[0], 1))
+
+def last_line_with(output, marker):
+    # Walk back from the end of the output: iperf3 prints its summary last
+    idx = output.rfind(marker)
+    while idx != -1:
+        line_start = output.rfind(b"\n", 0, idx) + 1
+        line_end = output.find(b"\n", idx)
+        line = output[line_start:line_end if line_end != -1 else len(output)]
+        if b"bits/sec" in line:
+            return line.strip()
+        idx = output.rfind(marker, 0, line_start)
+    return b""
+
+def parse_udp_text(output):
+    udp_bw_bps = udp_jitter = udp_loss = "-"
+    match = _UDP_SUMMARY.search(last_line_with(output, b"receiver"))
+    if match:
+        fields = match.groupdict()
+        udp_bw_bps = to_bps(fields["bw"].decode("ascii"))
+        if fields["jit"]:
+            udp_jitter = fields["jit"].decode("ascii") + "ms"
+            udp_loss = fields["loss"].decode("ascii") + "%"
+    return udp_bw_bps, udp_jitter, udp_loss
+
+def parse_tcp_text(output):
+    tcp_bw_bps = "-"
+    line = last_line_with(output, b"receiver")
+    if line:
+        match = _BW.search(line)
         if match:
-            avg_latency = match.group(1) + "ms"
-    return avg_latency, loss
-
-# Initial Ping Check
-reachable = subprocess.run(["ping", "-c", "3", args.server], capture_output=True, text=True)
-status = "OK" if "0% packet loss" in reachable.stdout else "FAIL"
-
-if status == "FAIL":
-    print(f"[ERROR] Server {args.server} unreachable. Test aborted.")
-    sys.exit(1)
-
-print("[INFO] Starting baseline ping...")
-run_and_save(["ping", "-c", str(args.duration // 2), args.server], ping_tmp)
-base_lat, base_loss = parse_ping(ping_tmp)
-
-# Live Ping
-print("[INFO] Starting live ping during iperf test...")
-live_ping = run_and_save(["ping", args.server], ping_live_tmp, live=True)
-
-# UDP Test
-print("[INFO] Running UDP test...")
-udp_cmd = ["iperf3", "-c", args.server, "-p", str(args.port), "-u", "-t", str(args.duration), "-b", args.udp_bandwidth]
-if args.direction == "download":
-    udp_cmd.append("--reverse")
-udp_output = run_and_save(udp_cmd, udp_tmp)
-
-# TCP Test
-print("[INFO] Running TCP test...")
-tcp_cmd = ["iperf3", "-c", args.server, "-p", str(args.port), "-t", str(args.duration)]
-if args.direction == "download":
-    tcp_cmd.append("--reverse")
-tcp_output = run_and_save(tcp_cmd, tcp_tmp)
-
-# Kill live ping
-live_ping.terminate()
-print("[INFO] Running post-test ping...")
-run_and_save(["ping", "-c", str(args.duration // 2), args.server], ping_post_tmp)
-
-live_lat, live_loss = parse_ping(ping_live_tmp)
-post_lat, post_loss = parse_ping(ping_post_tmp)
+            tcp_bw_bps = to_bps(match.group(1).decode("ascii"))
+    return tcp_bw_bps
+
+def udp_received_bps(end, udp_sum):
+    if end.get("sum_received"):
+        return int(end["sum_received"]["bits_per_second"])
+    # Older iperf3 builds only report "sum", which is the sending side's rate
+    # when this end sent the stream: scale it by the datagrams that arrived
+    if not udp_sum.get("sender", args.direction == "upload"):
+        return int(udp_sum["bits_per_second"])
+    packets = udp_sum.get("packets")
+    if not packets:
+        return "-"
+    delivered = (packets - udp_sum.get("lost_packets", 0)) / packets
+    return int(udp_sum["bits_per_second"] * delivered)
+
+def parse_udp(output):
+    try:
+        end = json.loads(output).get("end", {})
+    except ValueError:
+        # Not JSON (iperf3 without -J support): scan the text receiver line
+        return parse_udp_text(output)
+    udp_sum = end.get("sum")
+    if not udp_sum:
+        return "-", "-", "-"
+    return (udp_received_bps(end, udp_sum),
+            f"{udp_sum['jitter_ms']:.3f}ms",
+            f"{round(udp_sum['lost_percent'], 2):g}%")
+
+def parse_tcp(output):
+    try:
+        end = json.loads(output).get("end", {})
+    except ValueError:
+        return parse_tcp_text(output)
+    received = end.get("sum_received")
+    if not received:
+        return "-"
+    return int(received["bits_per_second"])
+
+# Test Settings
+check_ports = sorted({args.port, tcp_port})
+status = "OK"
+
+# iperf3 Commands
+reverse = ["--reverse"] if args.direction == "download" else []
+udp_cmd = ["iperf3", "-c", args.server, "-p", PORT_S, "-u", "-t", DUR_S, "-b", args.udp_bandwidth, "-J", *reverse]
+tcp_cmd = ["iperf3", "-c", args.server, "-p", TCP_PORT_S, "-t", DUR_S, "-J", *reverse]
+ping_cmd = ["ping", "-i", "1", args.server]
+
+# Test Run
+
+async def main():
+    # Reachability Check
+    # A TCP connect to the iperf3 port(s) checks the server and the port we are
+    # about to test in one round trip, and still works where ICMP is filtered.
+    try:
+        server_addr = socket.gethostbyname(args.server)
+        await asyncio.gather(*(port_open(server_addr, check_port) for check_port in check_ports))
+    except (OSError, asyncio.TimeoutError) as e:
+        print(f"[ERROR] Server {args.server} unreachable on iperf3 port(s) {', '.join(map(str, check_ports))} ({str(e) or 'timed out'}). Test aborted.")
+        sys.exit(1)
+    print(f"[INFO] Server {args.server} ({server_addr}) reachable")
+
+    # One ping for the whole run: baseline, live (during iperf3) and post-test
+    # windows are sliced from its replies afterwards.
+    print("[INFO] Starting baseline ping...")
+    ping_start = time.monotonic()
+    ping = await run_live(ping_cmd, ping_tmp)
+    await asyncio.sleep(half_duration)
+    print("[INFO] Live ping continues during iperf test...")
+
+    if tcp_port != args.port:
+        # An iperf3 server handles one test at a time, so UDP and TCP can only
+        # overlap when they target two different server ports.
+        print(f"[INFO] Running UDP (port {args.port}) and TCP (port {tcp_port}) tests concurrently...")
+        udp_output, tcp_output = await asyncio.gather(run(udp_cmd, udp_tmp, persist_tmp),
+                                                      run(tcp_cmd, tcp_tmp, persist_tmp))
+    else:
+        print("[INFO] Running UDP test...")
+        udp_output = await run(udp_cmd, udp_tmp, persist_tmp)
+        print("[INFO] Running TCP test...")
+        tcp_output = await run(tcp_cmd, tcp_tmp, persist_tmp)
+
+    t_iperf_end = time.monotonic()
+    print("[INFO] Running post-test ping...")
+    await asyncio.sleep(half_duration + 1)  # one extra interval for the window's last reply
+    await stop_ping(ping)
+    return ping_start, t_iperf_end, udp_output, tcp_output
+
+ping_start, t_iperf_end, udp_output, tcp_output = asyncio.run(main())
+
+ping_output = read_log(ping_tmp)
+ping_samples = parse_ping_samples(ping_output)
+# Echo requests go out once per second from ping_start, request N in second
+# N - seq_base of the run. The baseline is the first half_duration requests;
+# any request sent before iperf3 finished, even in its last partial second,
+# is live; the post window is the half_duration requests after that.
+live_first = seq_base + half_duration
+post_first = max(live_first, seq_base + math.ceil(t_iperf_end - ping_start))
+base_rtts, base_loss = ping_window(ping_samples, seq_base, live_first)
+live_rtts, live_loss = ping_window(ping_samples, live_first, post_first)
+post_rtts, post_loss = ping_window(ping_samples, post_first, post_first + half_duration)
+base_stats = rtt_stats(base_rtts)
+live_stats = rtt_stats(live_rtts)
+post_stats = rtt_stats(post_rtts)
+base_lat = fmt_ms(base_stats, "avg")
+live_lat = fmt_ms(live_stats, "avg")
+post_lat = fmt_ms(post_stats, "avg")
 
 # Parse UDP
-udp_bw = udp_jitter = udp_loss = "-"
-for line in udp_output.splitlines():
-    if "receiver" in line and "bits/sec" in line:
-        udp_bw_match = re.search(r"(\d+(?:\.\d+)? \wbits/sec)", line)
-        if udp_bw_match:
-            udp_bw = udp_bw_match.group(1)
-        jitter_match = re.search(r"(\d+\.\d+) ms", line)
-        if jitter_match:
-            udp_jitter = jitter_match.group(1) + "ms"
-        loss_match = re.search(r"\((\d+(?:\.\d+)?)%\)", line)
-        if loss_match:
-            udp_loss = loss_match.group(1) + "%"
-        break
+udp_bw_bps, udp_jitter, udp_loss = parse_udp(udp_output)
+udp_bw = format_bps(udp_bw_bps)
 
 # Parse TCP
-tcp_bw = "-"
-for line in tcp_output.splitlines():
-    if "receiver" in line and "bits/sec" in line:
-        match = re.search(r"(\d+(?:\.\d+)? \wbits/sec)", line)
-        if match:
-            tcp_bw = match.group(1)
-        break
+tcp_bw_bps = parse_tcp(tcp_output)
+tcp_bw = format_bps(tcp_bw_bps)
 
 # Summary
-summary_line = (f"{timestamp} STATUS={status} SERVER={args.server}:{args.port} DURATION={args.duration}s "
-                f"LATENCY={base_lat} PING_LOSS={base_loss} "
-                f"LIVE_LAT={live_lat} LIVE_LOSS={live_loss} "
-                f"POST_LAT={post_lat} POST_LOSS={post_loss} "
-                f"UDP_BW={udp_bw} UDP_JITTER={udp_jitter} UDP_LOSS={udp_loss} "
-                f"TCP_BW={tcp_bw}")
+if args.oneshot_json:
+    record = {
+        "timestamp": timestamp, "status": status, "server": args.server, "port": args.port,
+        "duration": args.duration,
+        "latency_ms": json_ms(base_stats, "avg"), "ping_loss_pct": json_num(base_loss),
+        "live_latency_ms": json_ms(live_stats, "avg"), "live_loss_pct": json_num(live_loss),
+        "post_latency_ms": json_ms(post_stats, "avg"), "post_loss_pct": json_num(post_loss),
+        "udp_bw_bps": json_num(udp_bw_bps), "udp_jitter_ms": json_num(udp_jitter),
+        "udp_loss_pct": json_num(udp_loss), "tcp_bw_bps": json_num(tcp_bw_bps),
+        "latency_p95_ms": json_ms(base_stats, "p95"), "latency_mdev_ms": json_ms(base_stats, "mdev"),
+        "live_p95_ms": json_ms(live_stats, "p95"), "live_mdev_ms": json_ms(live_stats, "mdev"),
+        "post_p95_ms": json_ms(post_stats, "p95"), "post_mdev_ms": json_ms(post_stats, "mdev"),
+    }
+    summary_line = json.dumps(record, separators=(",", ":"))
+else:
+    summary_line = (f"{timestamp} STATUS={status} SERVER={args.server}:{args.port} DURATION={args.duration}s "
+                    f"LATENCY={base_lat} PING_LOSS={base_loss} "
+                    f"LIVE_LAT={live_lat} LIVE_LOSS={live_loss} "
+                    f"POST_LAT={post_lat} POST_LOSS={post_loss} "
+                    f"UDP_BW={udp_bw} UDP_BW_BPS={udp_bw_bps} UDP_JITTER={udp_jitter} UDP_LOSS={udp_loss} "
+                    f"TCP_BW={tcp_bw} TCP_BW_BPS={tcp_bw_bps} "
+                    f"LAT_P95={fmt_ms(base_stats, 'p95')} LAT_MDEV={fmt_ms(base_stats, 'mdev')} "
+                    f"LIVE_P95={fmt_ms(live_stats, 'p95')} LIVE_MDEV={fmt_ms(live_stats, 'mdev')} "
+                    f"POST_P95={fmt_ms(post_stats, 'p95')} POST_MDEV={fmt_ms(post_stats, 'mdev')}")
 print("\n[RESULT]", summary_line)
 
-with open(summary_log_file, "a") as f:
-    f.write(summary_line + "\n")
+# One write() on an O_APPEND fd is atomic for a short line, so summary lines
+# from overlapping cron runs cannot interleave
+fd = os.open(summary_log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+try:
+    os.write(fd, (summary_line + "\n").encode())
+finally:
+    os.close(fd)
 
 if args.debug:
-    print("\n[DEBUG] --- Ping Output (Base) ---\n", open(ping_tmp).read())
-    print("\n[DEBUG] --- Ping Output (Live) ---\n", open(ping_live_tmp).read())
-    print("\n[DEBUG] --- Ping Output (Post) ---\n", open(ping_post_tmp).read())
-    print("\n[DEBUG] --- UDP Output ---\n", udp_output)
-    print("\n[DEBUG] --- TCP Output ---\n", tcp_output)
+    print("\n[DEBUG] --- Ping Output (Base + Live + Post) ---\n", ping_output.decode(errors="replace"))
+    for name, stats in (("Base", base_stats), ("Live", live_stats), ("Post", post_stats)):
+        print(f"[DEBUG] RTT {name}: " + " ".join(f"{key}={fmt_ms(stats, key)}" for key in ("avg", "p50", "p95", "p99", "mdev")))
+    print("\n[DEBUG] --- UDP Output ---\n", udp_output.decode(errors="replace"))
+    print("\n[DEBUG] --- TCP Output ---\n", tcp_output.decode(errors="replace"))
 
 # Clean temp logs if requested
 if args.clean_tmp:
-    for file in [ping_tmp, ping_live_tmp, ping_post_tmp, udp_tmp, tcp_tmp]:
+    for file in [ping_tmp, udp_tmp, tcp_tmp]:
         try:
             os.remove(file)
         except Exception: